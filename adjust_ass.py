@@ -4,55 +4,180 @@ Extend subtitle durations in .ass files without overlaps, adding a safety buffer
 Usage: python adjust_ass.py input.ass output.ass 500
 """
 
+import codecs
+import mmap
+import os
 import re
+import shutil
 import sys
-from datetime import timedelta, datetime
+import tempfile
+from collections import namedtuple
 
 # Default safety buffer in milliseconds
 BUFFER_MS = 50
 
+# Output buffer size; the adjusted file is written as many small slices
+WRITE_BUFFER_SIZE = 1 << 20
+
+# Every event line starts with this prefix
+DIALOGUE_PREFIX = b"Dialogue: "
+
+# Style override blocks such as {\an5} or {\i1}
+OVERRIDE_RE = re.compile(r"\{[^}]*\}")
+
+# A block switching on drawing mode ({\p1}) and the drawing commands after it
+DRAWING_RE = re.compile(r"\{[^}]*\\p[1-9][^}]*\}[^{]*")
+
+# One subtitle event: start/end in centiseconds and plain (tag-free) text
+DialogueEvent = namedtuple("DialogueEvent", ["start", "end", "text"])
+
 def parse_time(timestr):
-    # Format: h:mm:ss.cs  (e.g. 0:00:03.14)
-    return datetime.strptime(timestr, "%H:%M:%S.%f")
+    # Format: h:mm:ss.cs  (e.g. 0:00:03.14) -> integer centiseconds
+    h, m, rest = timestr.split(":")
+    sec, cs = rest.split(".")
+    return ((int(h) * 60 + int(m)) * 60 + int(sec)) * 100 + int(cs)
+
+def format_time(t):
+    # Integer centiseconds -> h:mm:ss.cs
+    h, r = divmod(t, 360000)
+    m, r = divmod(r, 6000)
+    s, cs = divmod(r, 100)
+    return f"{h}:{m:02d}:{s:02d}.{cs:02d}"
+
+def format_srt_time(t):
+    # Integer centiseconds -> hh:mm:ss,mmm
+    h, r = divmod(t, 360000)
+    m, r = divmod(r, 6000)
+    s, cs = divmod(r, 100)
+    return f"{h:02d}:{m:02d}:{s:02d},{cs * 10:03d}"
+
+def iter_dialogue(buf):
+    # Yield (c1, c2, c3, eol) for each "Dialogue: layer,start,end,rest" line in
+    # a bytes-like buffer: the start time is buf[c1+1:c2], the end time
+    # buf[c2+1:c3] and the rest of the line buf[c3+1:eol]. Plain find() calls
+    # locate the fields, so there is no regex backtracking over long lines.
+    plen = len(DIALOGUE_PREFIX)
+    needle = b"\n" + DIALOGUE_PREFIX
+    size = len(buf)
+    if buf[:plen] == DIALOGUE_PREFIX:
+        line = 0
+    else:
+        hit = buf.find(needle)
+        line = hit + 1 if hit != -1 else None
+    while line is not None:
+        eol = buf.find(b"\n", line)
+        if eol == -1:
+            eol = size
+        c1 = buf.find(b",", line + plen, eol)
+        c2 = buf.find(b",", c1 + 1, eol) if c1 != -1 else -1
+        c3 = buf.find(b",", c2 + 1, eol) if c2 != -1 else -1
+        # Same shape the old "^(Dialogue: \d+),([\d:.]+),([\d:.]+),(.*)$" regex accepted
+        if (c3 != -1 and buf[line + plen:c1].isdigit()
+                and c2 > c1 + 1 and c3 > c2 + 1
+                and buf[c1 + 1:c3].translate(None, b"0123456789:.") == b","):
+            yield c1, c2, c3, eol
+        hit = buf.find(needle, eol)
+        line = hit + 1 if hit != -1 else None
 
-def format_time(dt):
-    return dt.strftime("%H:%M:%S.%f")[:-4]  # trim to 2 decimals
+def extend_ends(starts, ends, lead_out_ms, buffer_ms=BUFFER_MS):
+    # Extend every end by the lead-out, capped at the next later start minus
+    # the safety buffer so subtitles never overlap. Times are in centiseconds,
+    # the .ass native resolution. Events are compared in start-time order, not
+    # file order, so multi-style or out-of-order tracks are handled correctly;
+    # events sharing a start time are capped by the next later start.
+    lead_out_cs = lead_out_ms // 10
+    buffer_cs = buffer_ms // 10
+    order = sorted(range(len(starts)), key=starts.__getitem__)
+
+    # Sweep from the latest start backwards, keeping the cap for the
+    # current start time and the one the next earlier start time will use
+    new_ends = [0] * len(starts)
+    cap = next_cap = sys.maxsize
+    last_start = None
+    for i in reversed(order):
+        if starts[i] != last_start:
+            last_start = starts[i]
+            cap = next_cap
+            next_cap = last_start - buffer_cs
+        new_ends[i] = min(ends[i] + lead_out_cs, cap)
+    return new_ends
 
 def adjust_ass_file(input_file, output_file, lead_out_ms, buffer_ms=BUFFER_MS):
-    with open(input_file, "r", encoding="utf-8-sig") as f:
-        lines = f.readlines()
-
-    dialogue_lines = []
-    pattern = re.compile(r"^(Dialogue: \d+),([\d:.]+),([\d:.]+),(.*)$")
-
-    # Extract all dialogue lines
-    for i, line in enumerate(lines):
-        m = pattern.match(line)
-        if m:
-            start = parse_time(m.group(2))
-            end = parse_time(m.group(3))
-            dialogue_lines.append((i, start, end, m))
-
-    # Adjust times
-    for idx, (i, start, end, m) in enumerate(dialogue_lines):
-        new_end = end + timedelta(milliseconds=lead_out_ms)
-
-        # Prevent overlap with next subtitle and add safety buffer
-        if idx + 1 < len(dialogue_lines):
-            next_start = dialogue_lines[idx + 1][1]
-            if new_end >= next_start - timedelta(milliseconds=buffer_ms):
-                new_end = next_start - timedelta(milliseconds=buffer_ms)
-
-        # Rebuild line
-        new_line = f"{m.group(1)},{format_time(start)},{format_time(new_end)},{m.group(4)}\n"
-        lines[i] = new_line
-
-    # Write result
-    with open(output_file, "w", encoding="utf-8") as f:
-        f.writelines(lines)
+    # Write to a temp file next to the output and move it into place once the
+    # input is closed, so input and output may be the same file
+    fd, tmp_file = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(os.path.abspath(output_file)))
+    try:
+        with open(fd, "wb", buffering=WRITE_BUFFER_SIZE) as out, open(input_file, "rb") as f:
+            _write_adjusted(f, out, lead_out_ms, buffer_ms)
+        # mkstemp creates the file owner-only; give it the input's permissions
+        shutil.copymode(input_file, tmp_file)
+        os.replace(tmp_file, output_file)
+    except BaseException:
+        os.remove(tmp_file)
+        raise
 
     print(f"Adjusted file saved as {output_file} with lead-out {lead_out_ms} ms and buffer {buffer_ms} ms")
 
+def _write_adjusted(f, out, lead_out_ms, buffer_ms):
+    # Copy the open .ass file f to out with every end time extended;
+    # mmap cannot map an empty file, and there is nothing to adjust anyway
+    if os.fstat(f.fileno()).st_size:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            # First pass: record only the byte span of each start,end time
+            # field and its parsed values
+            spans = []
+            for c1, c2, c3, _ in iter_dialogue(mm):
+                spans.append((c1 + 1, c3,
+                              parse_time(mm[c1 + 1:c2].decode("ascii")),
+                              parse_time(mm[c2 + 1:c3].decode("ascii"))))
+
+            new_ends = extend_ends([span[2] for span in spans],
+                                   [span[3] for span in spans],
+                                   lead_out_ms, buffer_ms)
+
+            # Second pass: copy the file through, patching each time field
+            pos = len(codecs.BOM_UTF8) if mm[:3] == codecs.BOM_UTF8 else 0
+            for (field_start, field_end, start, _), new_end in zip(spans, new_ends):
+                out.write(mm[pos:field_start])
+                out.write(f"{format_time(start)},{format_time(new_end)}".encode("ascii"))
+                pos = field_end
+            out.write(mm[pos:])
+
+def parse_ass(path):
+    # Read the Dialogue events of an .ass file as a list of DialogueEvent,
+    # leaving out events with no text once tags are stripped
+    with open(path, "rb") as f:
+        data = f.read()
+
+    events = []
+    for c1, c2, c3, eol in iter_dialogue(data):
+        # Text is the last of Style,Name,MarginL,MarginR,MarginV,Effect,Text
+        # Undecodable bytes (a file saved in another encoding) become U+FFFD
+        # rather than failing the whole file
+        text = data[c3 + 1:eol].split(b",", 6)[-1].decode("utf-8", errors="replace").rstrip("\r")
+        text = OVERRIDE_RE.sub("", DRAWING_RE.sub("", text)).replace("\\N", "\n").replace("\\n", "\n").replace("\\h", " ")
+        # Nothing to show (e.g. a {\p1} drawing or an empty Text field)
+        if not text.strip():
+            continue
+        events.append(DialogueEvent(parse_time(data[c1 + 1:c2].decode("ascii")),
+                                    parse_time(data[c2 + 1:c3].decode("ascii")),
+                                    text))
+    return events
+
+def adjust_times(events, lead_out_ms, buffer_ms=BUFFER_MS):
+    # Return events with their ends extended as adjust_ass_file does
+    new_ends = extend_ends([e.start for e in events], [e.end for e in events],
+                           lead_out_ms, buffer_ms)
+    return [e._replace(end=end) for e, end in zip(events, new_ends)]
+
+def write_srt(events, path):
+    # Write events as SRT blocks numbered in start-time order, since .ass
+    # events need not be sorted (multi-style or out-of-order tracks)
+    blocks = [f"{i}\n{format_srt_time(e.start)} --> {format_srt_time(e.end)}\n{e.text}\n"
+              for i, e in enumerate(sorted(events, key=lambda e: e.start), 1)]
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(blocks))
+
 # Command-line interface
 if __name__ == "__main__":
     if len(sys.argv) != 4:
@@ -3,16 +3,25 @@ import sys
 import subprocess
 import time
 import logging
-import queue
 import threading
 import shutil
+import signal
 import hashlib
 import json
+import mmap
+import sqlite3
 import datetime
 import argparse
+import collections
+import ctypes
+import concurrent.futures
+import errno
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 
+from adjust_ass import adjust_times, parse_ass, write_srt
+from translate_srt import translate_texts
+
 # --- Configuration ---
 # Directory to watch for new .wav files (relative to this script's location)
 WATCHED_FOLDER_NAME = "Work_room"
@@ -21,117 +30,367 @@ WATCHED_FOLDER_NAME = "Work_room"
 # This ensures paths are correct regardless of where the script is executed from
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 
+# SQLite database holding per-file workflow metadata
+METADATA_DB_PATH = os.path.join(SCRIPT_DIR, "metadata.sqlite")
+
+# Set DEBUG_META=1 to store steps_completed as indented JSON for easier
+# inspection; it is stored compactly otherwise
+META_JSON_ARGS = {"indent": 2} if os.environ.get("DEBUG_META") == "1" else {"separators": (",", ":")}
+
 # Directory for intermediate artifacts
 ARTIFACTS_DIR = os.path.join(SCRIPT_DIR, "artifacts")
-os.makedirs(ARTIFACTS_DIR, exist_ok=True)
-
-# Set up logging
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s %(levelname)s %(message)s",
-    handlers=[logging.StreamHandler(), logging.FileHandler(os.path.join(SCRIPT_DIR, "audio_workflow.log"), encoding="utf-8")]
-)
+
+# Log file written next to the script (configured by _init_runtime)
+LOG_PATH = os.path.join(SCRIPT_DIR, "audio_workflow.log")
+
 logger = logging.getLogger(__name__)
 
 # Full path to the watched folder
 WATCHED_FOLDER_PATH = os.path.join(SCRIPT_DIR, WATCHED_FOLDER_NAME)
 
-# Paths to the batch scripts (relative to SCRIPT_DIR)
+# Path to the batch script (relative to SCRIPT_DIR)
 PROCESS_AUDIO_SCRIPT = os.path.join(SCRIPT_DIR, "process_audio.bat")
-TRANSLATE_SRT_SCRIPT = os.path.join(SCRIPT_DIR, "translate_srt_to_chinese.bat")
 
-# Path to ffmpeg.exe (assuming it's in the same directory as this script)
-# If ffmpeg is in your system PATH, you can just use "ffmpeg" instead.
-FFMPEG_PATH = os.path.join(SCRIPT_DIR, "ffmpeg.exe")
-# FFMPEG_PATH = "ffmpeg" # Use this if relying on PATH
+# Language the subtitles are translated to
+TRANSLATE_DEST_LANG = "zh-tw"
 
-# --- Work Queue and Worker Thread ---
-# Create a queue for processing tasks
-work_q = queue.Queue()
+# Extra time (ms) added to the end of each subtitle before writing the .srt
+# files; 0 keeps the timings from the .ass unchanged (see adjust_ass.py)
+SUBTITLE_LEAD_OUT_MS = 0
 
-def worker_loop():
-    """Worker thread function that processes tasks from the queue."""
-    while True:
-        task = work_q.get()
-        if task is None:
-            break
+# Suffix (appended to the base filename) of the translated subtitle file
+TRANSLATED_SUFFIX = "_zh-tw.srt"
+
+# Final outputs moved from SCRIPT_DIR to Work_room after step 3
+OUTPUT_SUFFIXES = (".ass", ".srt", ".mp4", TRANSLATED_SUFFIX)
+
+# Intermediate files moved from the artifacts directory to Work_room after step 3
+ARTIFACT_SUFFIXES = (".ass", ".ass.orig")
+
+# Number of files processed concurrently
+WORKER_COUNT = min(4, os.cpu_count() or 1)
+
+# Number of step 1 runs (Whisper transcription) allowed at the same time
+STEP1_CONCURRENCY = 1
+
+# Number of trailing subprocess output lines kept for error reporting
+OUTPUT_TAIL_LINES = 200
+
+# Read size used when hashing files
+HASH_CHUNK_SIZE = 1 << 20
+
+# Files up to this size are memory-mapped for hashing; larger ones are streamed
+MMAP_HASH_LIMIT = 1 << 30
+
+# When the script runs without a console on Windows (e.g. under pythonw),
+# keep child processes (cmd.exe running the .bat) from popping up a console
+# window each. With a console they share it, as before, and so also get Ctrl+C.
+if os.name == "nt" and not ctypes.windll.kernel32.GetConsoleWindow():
+    _startupinfo = subprocess.STARTUPINFO()
+    _startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+    _startupinfo.wShowWindow = subprocess.SW_HIDE
+    SUBPROCESS_WINDOW_ARGS = {"startupinfo": _startupinfo, "creationflags": subprocess.CREATE_NO_WINDOW}
+else:
+    SUBPROCESS_WINDOW_ARGS = {}
+
+# Seconds without modify events (and without a size change) after which a
+# new .wav is considered complete
+WAV_QUIET_TIME = 1.0
+
+# Seconds without modify events after which an edited .ass is considered saved
+ASS_STABLE_TIME = 1.0
+
+# Seconds between checks for Ctrl+C while waiting on the observer or the
+# running jobs at shutdown (Windows only)
+STOP_CHECK_INTERVAL = 1.0
+
+# Set by main() while the watcher runs; see wait_for_stable
+stability_tracker = None
+
+# --- Worker Pool ---
+# Files are processed concurrently by a bounded pool of worker threads
+# (a ThreadPoolExecutor created by _init_runtime)
+executor = None
+
+# Per-base locks so the same file is never processed by two workers at once
+_base_locks = collections.defaultdict(threading.Lock)
+_base_locks_guard = threading.Lock()
+
+# Futures of submitted jobs that have not finished yet
+_active_futures = set()
+
+# Child processes started by run_command that are still running
+_running_children = set()
+
+# Limits how many step 1 runs (Whisper + ffmpeg) share the CPU/GPU at once
+step1_slots = threading.Semaphore(STEP1_CONCURRENCY)
+
+def submit_work(base):
+    """
+    Schedule a base filename for processing on the worker pool.
+    
+    Args:
+        base (str): Base filename without extension
+        
+    Returns:
+        concurrent.futures.Future: Completes when processing has finished
+    """
+    future = executor.submit(process_base, base)
+    _active_futures.add(future)
+    future.add_done_callback(_active_futures.discard)
+    return future
+
+def process_base(base):
+    """Worker function that runs the missing pipeline steps for one file."""
+    with _base_locks_guard:
+        base_lock = _base_locks[base]
+    with base_lock:
         try:
-            base = task
             logger.info("Worker starting processing for %s", base)
             
             # Load metadata to determine which steps to run
-            m = load_meta(base)
+            m = meta_store.get(base)
             
             if m.get("steps_completed", {}).get("process_audio"):
                 # Run steps 2 and 3 only if missing
+                events = None
                 if not m.get("steps_completed", {}).get("ass_to_srt"):
-                    step2_ass_to_srt(base)
-                    # Update metadata
-                    meta = load_meta(base)
-                    meta.setdefault("steps_completed", {})["ass_to_srt"] = True
-                    meta["last_updated"] = datetime.datetime.utcnow().isoformat()
-                    save_meta(base, meta)
+                    events = step2_ass_to_srt(base)
+                    meta_store.update(base, completed=("ass_to_srt",))
                     
                 if not m.get("steps_completed", {}).get("translate"):
-                    step3_translate_srt(base)
-                    # Update metadata
-                    meta = load_meta(base)
-                    meta.setdefault("steps_completed", {})["translate"] = True
-                    meta["last_updated"] = datetime.datetime.utcnow().isoformat()
-                    save_meta(base, meta)
+                    step3_translate_srt(base, events)
+                    meta_store.update(base, completed=("translate",))
             else:
-                # Run full sequence
-                step1_process_audio(base)
-                step2_ass_to_srt(base)
-                step3_translate_srt(base)
+                # Run full sequence, handing the parsed subtitles from
+                # step 2 straight to step 3
+                with step1_slots:
+                    step1_process_audio(base)
+                events = step2_ass_to_srt(base)
+                step3_translate_srt(base, events)
                 
                 # Update metadata for steps 2 and 3
-                meta = load_meta(base)
-                meta.setdefault("steps_completed", {})["ass_to_srt"] = True
-                meta.setdefault("steps_completed", {})["translate"] = True
-                meta["last_updated"] = datetime.datetime.utcnow().isoformat()
-                save_meta(base, meta)
+                meta_store.update(base, completed=("ass_to_srt", "translate"))
                         
         except Exception:
             logger.exception("Worker error processing %s", base)
-        finally:
-            work_q.task_done()
-
-# Start the worker thread
-worker_thread = threading.Thread(target=worker_loop, daemon=True)
-worker_thread.start()
 
 
 # --- Metadata and File Hashing Helpers ---
-def meta_path(base):
-    """Return the path to the metadata file for a given base filename."""
+def artifacts_dir_for(base):
+    """Return the artifacts directory for a given base filename."""
+    return os.path.join(ARTIFACTS_DIR, base)
+
+def legacy_meta_path(base):
+    """Return the path of the per-file JSON metadata used before MetaStore."""
     return os.path.join(SCRIPT_DIR, f"{base}.meta.json")
 
 def file_hash(path):
     """Calculate SHA256 hash of a file."""
-    h = hashlib.sha256()
     with open(path, "rb") as fh:
+        size = os.fstat(fh.fileno()).st_size
+        if not size:
+            # mmap cannot map an empty file
+            return hashlib.sha256(b"").hexdigest()
+        if size <= MMAP_HASH_LIMIT:
+            # Hash the mapped file in one call, without copying it into Python
+            with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return hashlib.sha256(mm).hexdigest()
+        # Stream larger files through one reused 1 MiB buffer, so each
+        # update() hashes many blocks (hashlib.file_digest only reads 256 KiB
+        # at a time)
+        h = hashlib.sha256()
+        buf = memoryview(bytearray(HASH_CHUNK_SIZE))
         while True:
-            chunk = fh.read(8192)
-            if not chunk:
+            n = fh.readinto(buf)
+            if not n:
                 break
-            h.update(chunk)
+            h.update(buf[:n])
     return h.hexdigest()
 
-def load_meta(base):
-    """Load metadata from file, returning empty dict if file doesn't exist."""
-    p = meta_path(base)
-    if os.path.exists(p):
-        with open(p, "r", encoding="utf-8") as fh:
-            return json.load(fh)
-    return {}
+def ass_fingerprint(path, st=None):
+    """
+    Return the metadata fields identifying the current contents of an .ass file.
+    
+    The size and mtime are taken before hashing, so if the file changes
+    while it is being hashed the stored stat is stale and the next check
+    hashes it again.
+    
+    Args:
+        path (str): Path to the .ass file
+        st (os.stat_result): Result of os.stat(path) if the caller already
+            has one; stat is called otherwise
+        
+    Returns:
+        dict: ass_hash, ass_size and ass_mtime_ns
+    """
+    if st is None:
+        st = os.stat(path)
+    return {"ass_hash": file_hash(path), "ass_size": st.st_size, "ass_mtime_ns": st.st_mtime_ns}
+
+class MetaStore:
+    """
+    Per-file workflow metadata in a single SQLite database, one row per base
+    filename. The database runs in WAL mode and each thread gets its own
+    connection.
+    
+    All writes are read-modify-write cycles inside BEGIN IMMEDIATE
+    transactions, which hold SQLite's write lock, so concurrent updates from
+    the workers and the .ass handler cannot lose each other's changes.
+    
+    get() returns the same dict shape the old .meta.json files held, plus
+    the .ass size/mtime the hash was taken at:
+    {"ass_hash": ..., "ass_size": ..., "ass_mtime_ns": ...,
+    "steps_completed": {...}, "last_updated": ...}.
+    """
+    # Column name -> SQLite type; missing columns are added on open
+    COLUMNS = {
+        "ass_hash": "TEXT",
+        "ass_size": "INTEGER",
+        "ass_mtime_ns": "INTEGER",
+        "steps_completed": "TEXT",
+        "last_updated": "TEXT",
+    }
+    # Columns callers may set directly through update()
+    SETTABLE = ("ass_hash", "ass_size", "ass_mtime_ns")
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (base TEXT PRIMARY KEY, "
+                     + ", ".join(f"{name} {kind}" for name, kind in self.COLUMNS.items()) + ")")
+        existing = {row[1] for row in conn.execute("PRAGMA table_info(meta)")}
+        for name, kind in self.COLUMNS.items():
+            if name not in existing:
+                conn.execute(f"ALTER TABLE meta ADD COLUMN {name} {kind}")
+
+    def _conn(self):
+        """Return this thread's connection, opening it on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Autocommit mode; transactions are started explicitly
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _read(self, conn, base):
+        """Return the stored metadata dict for base, or None if there is no row."""
+        row = conn.execute(
+            f"SELECT {', '.join(self.COLUMNS)} FROM meta WHERE base = ?", (base,)
+        ).fetchone()
+        if row is None:
+            return None
+        meta = {name: value for name, value in zip(self.COLUMNS, row) if value is not None}
+        meta["steps_completed"] = json.loads(meta.get("steps_completed") or "{}")
+        return meta
+
+    def _write(self, conn, base, meta):
+        """Insert or replace the row for base from a metadata dict."""
+        values = [meta.get(name) for name in self.COLUMNS]
+        values[list(self.COLUMNS).index("steps_completed")] = json.dumps(meta.get("steps_completed", {}), ensure_ascii=False, **META_JSON_ARGS)
+        conn.execute(
+            f"INSERT OR REPLACE INTO meta (base, {', '.join(self.COLUMNS)}) "
+            f"VALUES (?{', ?' * len(self.COLUMNS)})",
+            (base, *values)
+        )
+
+    def get(self, base):
+        """
+        Return the metadata for base, or an empty dict if there is none.
+        
+        A legacy {base}.meta.json file is imported the first time its base
+        is looked up.
+        """
+        conn = self._conn()
+        meta = self._read(conn, base)
+        if meta is None and self._import_legacy(base):
+            meta = self._read(conn, base)
+        return meta or {}
+
+    def modify(self, base, mutator):
+        """
+        Atomically read, modify and write the metadata for base.
+        
+        Args:
+            base (str): Base filename without extension
+            mutator (callable): Called with the current metadata dict while
+                the write lock is held; changes it in place, or returns
+                False to leave the stored metadata untouched
+                
+        Returns:
+            bool: True if the metadata was written
+        """
+        conn = self._conn()
+        if self._read(conn, base) is None:
+            self._import_legacy(base)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            meta = self._read(conn, base) or {}
+            if mutator(meta) is False:
+                conn.execute("ROLLBACK")
+                return False
+            meta["last_updated"] = datetime.datetime.utcnow().isoformat()
+            self._write(conn, base, meta)
+            conn.execute("COMMIT")
+            return True
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def update(self, base, completed=(), cleared=(), **fields):
+        """
+        Atomically mark steps and set fields for base.
+        
+        Args:
+            base (str): Base filename without extension
+            completed (iterable): Steps to mark as completed
+            cleared (iterable): Steps to mark as not completed
+            **fields: Columns from SETTABLE to set
+        """
+        unknown = set(fields) - set(self.SETTABLE)
+        if unknown:
+            raise ValueError(f"Unknown metadata fields: {sorted(unknown)}")
+        
+        def apply(meta):
+            steps = meta.setdefault("steps_completed", {})
+            for step in completed:
+                steps[step] = True
+            for step in cleared:
+                steps.pop(step, None)
+            meta.update(fields)
+        
+        self.modify(base, apply)
+
+    def _import_legacy(self, base):
+        """
+        Copy a legacy .meta.json file into the store and remove it.
+        
+        Returns:
+            bool: True if a legacy file was found
+        """
+        path = legacy_meta_path(base)
+        if not os.path.exists(path):
+            return False
+        with open(path, "r", encoding="utf-8") as fh:
+            meta = json.load(fh)
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if self._read(conn, base) is None:
+                self._write(conn, base, meta)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        os.remove(path)
+        return True
+
 
-def save_meta(base, meta):
-    """Save metadata to file atomically."""
-    tmp = meta_path(base) + ".tmp"
-    with open(tmp, "w", encoding="utf-8") as fh:
-        json.dump(meta, fh, indent=2, ensure_ascii=False)
-    os.replace(tmp, meta_path(base))
+# Shared metadata store for all workers and handlers, opened by _init_runtime
+meta_store = None
 
 
 # --- Step Functions ---
@@ -150,13 +409,7 @@ def step1_process_audio(base):
     # The batch script expects the filename without extension and
     # should be run from the script's directory
     cmd = [PROCESS_AUDIO_SCRIPT, base]
-    subprocess.run(
-        cmd,
-        check=True,              # Raises CalledProcessError on non-zero exit
-        capture_output=True,     # Captures stdout and stderr
-        text=True,               # Returns strings, not bytes
-        cwd=SCRIPT_DIR           # Run in the script's directory
-    )
+    run_command(cmd, cwd=SCRIPT_DIR)
     logger.info("[Step 1] process_audio.bat completed successfully.")
     
     # Check if the .ass file was actually created
@@ -169,17 +422,13 @@ def step1_process_audio(base):
     if not os.path.exists(orig):
         shutil.copy2(ass_file, orig)
         # Wait until the file is stable before computing hash
-        if not wait_until_stable(ass_file):
+        if not wait_for_stable(ass_file):
             logger.warning("ASS file %s did not stabilize", ass_file)
             return
-        meta = load_meta(base)
-        meta["ass_hash"] = file_hash(ass_file)
-        meta.setdefault("steps_completed", {})["process_audio"] = True
-        meta["last_updated"] = datetime.datetime.utcnow().isoformat()
-        save_meta(base, meta)
+        meta_store.update(base, **ass_fingerprint(ass_file), completed=("process_audio",))
         
         # Move intermediate files to artifacts directory
-        artifacts_dir = os.path.join(ARTIFACTS_DIR, base)
+        artifacts_dir = artifacts_dir_for(base)
         os.makedirs(artifacts_dir, exist_ok=True)
         
         # Move the .ass file to artifacts directory
@@ -203,89 +452,60 @@ def step1_process_audio(base):
 
 def step2_ass_to_srt(base):
     """
-    Step 2: Convert generated .ass to .srt using ffmpeg.
+    Step 2: Convert generated .ass to .srt in-process.
     
     Args:
         base (str): Base filename without extension
         
+    Returns:
+        list: The parsed DialogueEvent list, reusable by step 3
+        
     Raises:
-        subprocess.CalledProcessError: If the subprocess fails
+        OSError: If the .ass file cannot be read or the .srt written
     """
     logger.info("[Step 2] Converting '%s.ass' to '%s.srt'...", base, base)
-    # Use the .ass file from artifacts directory
-    artifacts_dir = os.path.join(ARTIFACTS_DIR, base)
-    ass_file = os.path.join(artifacts_dir, f"{base}.ass")
+    events = load_events(base)
     srt_file = os.path.join(SCRIPT_DIR, f"{base}.srt")
     
-    # Run ffmpeg to convert .ass to .srt
-    # Run it in the script directory
-    cmd = [FFMPEG_PATH, "-y", "-i", ass_file, srt_file]
-    subprocess.run(
-        cmd,
-        check=True,
-        capture_output=True,
-        text=True,
-        cwd=SCRIPT_DIR
-    )
+    # .ass -> .srt is a pure text transform, so no ffmpeg process is needed
+    write_srt(events, srt_file)
     logger.info("[Step 2] Conversion to .srt completed successfully.")
+    return events
 
 
-def step3_translate_srt(base):
+def step3_translate_srt(base, events=None):
     """
-    Step 3: Run translate_srt_to_chinese.bat to translate SRT file.
+    Step 3: Translate the subtitles in-process and write the translated SRT file.
     
     Args:
         base (str): Base filename without extension
+        events (list): DialogueEvent list from step 2; parsed from the
+            .ass again when not given (e.g. when resuming at step 3)
         
     Raises:
-        subprocess.CalledProcessError: If the subprocess fails
+        OSError: If the .ass file cannot be read or the .srt written
+        TranslationUnavailable: If the translation service stopped
+            responding; the step is then left incomplete
     """
-    logger.info("[Step 3] Running translate_srt_to_chinese.bat for '%s'...", base)
-    # The batch script expects the filename without extension
-    cmd = [TRANSLATE_SRT_SCRIPT, base]
-    subprocess.run(
-        cmd,
-        check=True,
-        capture_output=True,
-        text=True,
-        cwd=SCRIPT_DIR
-    )
-    logger.info("[Step 3] translate_srt_to_chinese.bat completed successfully.")
+    logger.info("[Step 3] Translating subtitles for '%s'...", base)
+    if events is None:
+        events = load_events(base)
+    translated = translate_texts([e.text for e in events], TRANSLATE_DEST_LANG)
+    write_srt([e._replace(text=text) for e, text in zip(events, translated)],
+              os.path.join(SCRIPT_DIR, base + TRANSLATED_SUFFIX))
+    logger.info("[Step 3] Translation completed successfully.")
     
     # Move all output files to the Work_room folder after completion
-    output_files = [
-        f"{base}.ass",
-        f"{base}.srt",
-        f"{base}.mp4",
-        f"{base}_zh-tw.srt"
-    ]
+    output_files = {base + suffix for suffix in OUTPUT_SUFFIXES}
     
     # Move files from SCRIPT_DIR to Work_room
-    for file in output_files:
-        src_path = os.path.join(SCRIPT_DIR, file)
-        dst_path = os.path.join(WATCHED_FOLDER_PATH, file)
-        if os.path.exists(src_path):
-            try:
-                shutil.move(src_path, dst_path)
-                logger.info("         Moved %s to Work_room folder", file)
-            except Exception as e:
-                logger.warning("         Could not move %s to Work_room folder: %s", file, e)
+    move_to_work_room(SCRIPT_DIR, output_files)
     
     # Also move the final files from artifacts directory to Work_room if they exist there
-    artifacts_dir = os.path.join(ARTIFACTS_DIR, base)
-    if os.path.exists(artifacts_dir):
-        for file in [f"{base}.ass", f"{base}.ass.orig"]:
-            src_path = os.path.join(artifacts_dir, file)
-            dst_path = os.path.join(WATCHED_FOLDER_PATH, file)
-            if os.path.exists(src_path):
-                try:
-                    shutil.move(src_path, dst_path)
-                    logger.info("         Moved %s from artifacts to Work_room folder", file)
-                except Exception as e:
-                    logger.warning("         Could not move %s from artifacts to Work_room folder: %s", file, e)
+    move_to_work_room(artifacts_dir_for(base), {base + suffix for suffix in ARTIFACT_SUFFIXES})
     
     # Log completion instead of automatically opening the file
-    final_srt = os.path.join(WATCHED_FOLDER_PATH, f"{base}_zh-tw.srt")
+    final_srt = os.path.join(WATCHED_FOLDER_PATH, base + TRANSLATED_SUFFIX)
     if os.path.exists(final_srt):
         logger.info("Translation completed. Final file is located at: %s", final_srt)
     else:
@@ -293,6 +513,153 @@ def step3_translate_srt(base):
 
 
 # --- Helper Functions ---
+def has_extension(path, ext):
+    """
+    Case-insensitive check that path ends with ext (e.g. ".wav").
+    
+    Only the last len(ext) characters are lowercased, instead of a copy of
+    the whole path for every file system event.
+    """
+    return path[-len(ext):].lower() == ext
+
+def move_file(src, dst):
+    """
+    Move a file, renaming in place when possible.
+    
+    os.replace is a single atomic rename on the same volume; across volumes
+    it fails with EXDEV, in which case shutil.move copies the file using the
+    OS's fast copy path and removes the source.
+    
+    Args:
+        src (str): Source path
+        dst (str): Destination path (overwritten if it exists)
+    """
+    try:
+        os.replace(src, dst)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        shutil.move(src, dst)
+
+def move_to_work_room(src_dir, names):
+    """
+    Move the named files that exist in src_dir to the Work_room folder.
+    
+    One directory listing finds the files instead of an existence check per
+    file; failures are logged and do not stop the remaining moves.
+    
+    Args:
+        src_dir (str): Directory to move files from (may not exist)
+        names (set): File names to move
+    """
+    try:
+        with os.scandir(src_dir) as entries:
+            found = [entry for entry in entries if entry.name in names and entry.is_file()]
+    except FileNotFoundError:
+        return
+    for entry in found:
+        try:
+            move_file(entry.path, os.path.join(WATCHED_FOLDER_PATH, entry.name))
+            logger.info("         Moved %s from %s to Work_room folder", entry.name, os.path.basename(src_dir))
+        except Exception as e:
+            logger.warning("         Could not move %s to Work_room folder: %s", entry.name, e)
+
+def load_events(base):
+    """
+    Parse the subtitle events from the .ass file in the artifacts directory.
+    
+    Args:
+        base (str): Base filename without extension
+        
+    Returns:
+        list: DialogueEvent list, with SUBTITLE_LEAD_OUT_MS applied
+    """
+    ass_file = os.path.join(artifacts_dir_for(base), f"{base}.ass")
+    events = parse_ass(ass_file)
+    if SUBTITLE_LEAD_OUT_MS:
+        events = adjust_times(events, SUBTITLE_LEAD_OUT_MS)
+    return events
+
+def run_command(cmd, cwd, tail_lines=OUTPUT_TAIL_LINES):
+    """
+    Run a command, streaming its combined output to the debug log.
+    
+    Only the last `tail_lines` lines are kept in memory, so long-running
+    children (Whisper, ffmpeg) do not accumulate their whole output; if
+    the command fails, that tail is logged as an error.
+    
+    Args:
+        cmd (list): Command and arguments
+        cwd (str): Working directory for the command
+        tail_lines (int): Number of trailing output lines kept for errors
+        
+    Raises:
+        subprocess.CalledProcessError: If the command exits non-zero; its
+            output attribute holds the retained tail
+    """
+    tail = collections.deque(maxlen=tail_lines)
+    with subprocess.Popen(
+        cmd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,  # Interleave stderr into the same stream
+        text=True,
+        errors="replace",
+        bufsize=1,                 # Line buffered
+        cwd=cwd,
+        **SUBPROCESS_WINDOW_ARGS   # No console window when running windowless
+    ) as proc:
+        _running_children.add(proc)
+        try:
+            for line in proc.stdout:
+                tail.append(line)
+                logger.debug("%s", line.rstrip())
+        finally:
+            _running_children.discard(proc)
+    if proc.returncode:
+        logger.error("%s exited with code %d; last %d lines of output:\n%s",
+                     os.path.basename(cmd[0]), proc.returncode, len(tail), "".join(tail).rstrip())
+        raise subprocess.CalledProcessError(proc.returncode, cmd, output="".join(tail))
+
+
+def kill_running_children():
+    """
+    Kill every child process started by run_command that is still running,
+    including the processes it started (Whisper, ffmpeg under the .bat).
+    """
+    for proc in list(_running_children):
+        logger.info("[STOP] Killing %s (pid %d)", os.path.basename(proc.args[0]), proc.pid)
+        try:
+            if os.name == "nt":
+                # /T takes the whole tree started by cmd.exe
+                subprocess.run(["taskkill", "/F", "/T", "/PID", str(proc.pid)],
+                               capture_output=True, **SUBPROCESS_WINDOW_ARGS)
+            else:
+                # Only the direct child; on a terminal, Ctrl+C has already
+                # reached the rest of the foreground process group
+                proc.kill()
+        except OSError as e:
+            logger.warning("[STOP] Could not kill pid %d: %s", proc.pid, e)
+
+def wait_for_stable(path, timeout=60, stable_time=1.0):
+    """
+    Wait until a file has stopped changing.
+    
+    Uses the watcher's StabilityTracker when it is running, which wakes on
+    file system events instead of polling; otherwise (e.g. for --resume)
+    falls back to wait_until_stable.
+    
+    Args:
+        path (str): Path to the file to monitor
+        timeout (int): Maximum time to wait in seconds
+        stable_time (float): Time without changes for the file to be considered stable
+        
+    Returns:
+        bool: True if file stabilized, False if timeout was reached
+    """
+    if stability_tracker is not None:
+        return stability_tracker.wait(path, stable_time=stable_time, timeout=timeout)
+    return wait_until_stable(path, timeout=timeout, stable_time=stable_time)
+
 def wait_until_stable(path, timeout=60, stable_time=1.0, poll=0.5):
     """
     Wait until a file's size stabilizes, indicating it's finished being written.
@@ -332,69 +699,271 @@ def wait_until_stable(path, timeout=60, stable_time=1.0, poll=0.5):
 
 
 # --- File Event Handlers ---
-class AssModifiedHandler(FileSystemEventHandler):
+class StabilityTracker(FileSystemEventHandler):
+    """
+    Records the time of the latest event for the files callers are waiting
+    on, so they can wait for a file to go quiet without polling its size.
+    
+    Events for other files (e.g. the log file and the metadata database in
+    SCRIPT_DIR) are ignored, and a path is forgotten once nobody waits on it.
+    """
+    def __init__(self):
+        super().__init__()
+        # Path -> number of wait() calls currently watching it
+        self._waiters = collections.Counter()
+        # Path -> time.monotonic() of the last event, for watched paths only
+        self._last_event = {}
+        self._cond = threading.Condition()
+
+    def on_any_event(self, event):
+        """Triggered for every file system event on the watched folders."""
+        if event.is_directory:
+            return
+        paths = [p for p in (event.src_path, getattr(event, "dest_path", None))
+                 if p and p in self._waiters]
+        if not paths:
+            return
+        now = time.monotonic()
+        with self._cond:
+            for path in paths:
+                if path in self._waiters:
+                    self._last_event[path] = now
+            self._cond.notify_all()
+
+    def wait(self, path, stable_time=1.0, timeout=60):
+        """
+        Block until no event for path has arrived for `stable_time` seconds.
+        
+        Only events during the wait are seen, so the quiet time is counted
+        from the start of the wait until the first event arrives.
+        
+        Args:
+            path (str): Path to the file to monitor
+            stable_time (float): Required quiet time in seconds
+            timeout (int): Maximum time to wait in seconds
+            
+        Returns:
+            bool: True if file stabilized, False if timeout was reached
+        """
+        start = time.monotonic()
+        deadline = start + timeout
+        with self._cond:
+            self._waiters[path] += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    quiet_at = self._last_event.get(path, start) + stable_time
+                    if now >= quiet_at:
+                        return True
+                    if now >= deadline:
+                        return False
+                    self._cond.wait(min(quiet_at, deadline) - now)
+            finally:
+                self._waiters[path] -= 1
+                if not self._waiters[path]:
+                    del self._waiters[path]
+                    self._last_event.pop(path, None)
+
+
+class DebouncedHandler(FileSystemEventHandler):
+    """
+    Base handler that coalesces bursts of events for the same file.
+    
+    Only events for files ending in `extension` (case-insensitive) are
+    dispatched. Every call to debounce(path) records the event time; one
+    thread per pending path sleeps until no further events have arrived
+    for `stable_time` seconds, then runs on_stable(path). Subclasses decide
+    which events call debounce.
+    """
+    def __init__(self, extension, stable_time):
+        super().__init__()
+        self.extension = extension
+        self.stable_time = stable_time
+        # Path -> time.monotonic() of the latest event, while pending
+        self._last_event = {}
+        self._lock = threading.Lock()
+
+    def dispatch(self, event):
+        """Pass on only file events whose source or destination has our extension."""
+        if event.is_directory:
+            return
+        if (has_extension(event.src_path, self.extension)
+                or has_extension(getattr(event, "dest_path", "") or "", self.extension)):
+            super().dispatch(event)
+
+    def debounce(self, path):
+        """Restart the quiet period for path."""
+        with self._lock:
+            pending = path in self._last_event
+            self._last_event[path] = time.monotonic()
+        if not pending:
+            threading.Thread(target=self._wait_quiet, args=(path,), daemon=True).start()
+
+    def is_pending(self, path):
+        """Return True if path is waiting for its quiet period to end."""
+        with self._lock:
+            return path in self._last_event
+
+    def _wait_quiet(self, path):
+        """Sleep until path has been quiet for stable_time, then call on_stable."""
+        while True:
+            with self._lock:
+                remaining = self._last_event[path] + self.stable_time - time.monotonic()
+                if remaining <= 0:
+                    del self._last_event[path]
+                    break
+            time.sleep(remaining)
+        try:
+            self.on_stable(path)
+        except Exception:
+            logger.exception("Error handling %s", path)
+
+    def on_stable(self, path):
+        """Called once path has been quiet for `stable_time` seconds."""
+        raise NotImplementedError
+
+
+class AssModifiedHandler(DebouncedHandler):
     """Handles file system events for .ass file modifications."""
     
+    def __init__(self, stable_time=ASS_STABLE_TIME):
+        super().__init__(extension=".ass", stable_time=stable_time)
+
     def on_modified(self, event):
         """Triggered when a file or directory is modified."""
-        if event.is_directory:
+        self.debounce(event.src_path)
+
+    def on_stable(self, path):
+        """Schedule steps 2 and 3 if the edited .ass content changed."""
+        base = os.path.splitext(os.path.basename(path))[0]
+        try:
+            st = os.stat(path)
+        except OSError:
             return
-        if not event.src_path.lower().endswith(".ass"):
+        
+        # Same size and mtime as when the hash was recorded: nothing to hash
+        meta = meta_store.get(base)
+        if (meta.get("ass_size"), meta.get("ass_mtime_ns")) == (st.st_size, st.st_mtime_ns):
             return
-            
-        base = os.path.splitext(os.path.basename(event.src_path))[0]
+        
         try:
-            # wait until stable then compute hash
-            if not wait_until_stable(event.src_path):
-                logger.warning("Edited .ass %s did not stabilize", event.src_path)
-                return
-            new_hash = file_hash(event.src_path)
+            fingerprint = ass_fingerprint(path, st)
         except Exception:
             return
-            
-        meta = load_meta(base)
-        old_hash = meta.get("ass_hash")
-        if old_hash != new_hash:
+        
+        edited = False
+        
+        def mark_edited(meta):
+            # Compare and set under the store's write lock, so a concurrent
+            # update between reading and writing the hash cannot be lost
+            nonlocal edited
+            edited = meta.get("ass_hash") != fingerprint["ass_hash"]
+            if not edited and all(meta.get(k) == v for k, v in fingerprint.items()):
+                return False
+            # Record the new size/mtime even if only the mtime changed, so
+            # the next event for the same file skips hashing
+            meta.update(fingerprint)
+            if edited:
+                meta.setdefault("steps_completed", {}).pop("ass_to_srt", None)
+                meta["steps_completed"].pop("translate", None)
+        
+        meta_store.modify(base, mark_edited)
+        if edited:
             logger.info("Detected edited .ass for %s — scheduling downstream steps", base)
-            meta["ass_hash"] = new_hash
-            meta.setdefault("steps_completed", {}).pop("ass_to_srt", None)
-            meta.setdefault("steps_completed", {}).pop("translate", None)
-            save_meta(base, meta)
-            work_q.put(base)  # worker should be adjusted to run only step2+3 if meta shows process_audio done
+            submit_work(base)  # the worker runs only step2+3 since meta shows process_audio done
 
 
-class WavHandler(FileSystemEventHandler):
+class WavHandler(DebouncedHandler):
     """
     Handles file system events. Specifically looks for new .wav files.
+    
+    A new .wav is considered completely written once no modify events have
+    arrived for it for `stable_time` seconds and its size is the same as at
+    the end of the previous quiet period. The size check covers
+    notifications Windows delivers late or not at all while a copy stalls.
     """
+    def __init__(self, stable_time=WAV_QUIET_TIME):
+        super().__init__(extension=".wav", stable_time=stable_time)
+        # Path -> size at the end of its last quiet period
+        self._quiet_sizes = {}
+
     def on_created(self, event):
         """
         Triggered when a file or directory is created.
         """
-        # We only care about files, not directories
-        if not event.is_directory:
-            # Get the full path of the created file
-            file_path = event.src_path
-            
-            # Check if the file has a .wav extension (case-insensitive)
-            if file_path.lower().endswith('.wav'):
-                logger.info("[WAV File Detected] %s", file_path)
-                
-                # Wait until the file is completely written (size stabilizes)
-                if not wait_until_stable(file_path):
-                    logger.warning("File %s did not stabilize in time; skipping for now", file_path)
-                    return
-                
-                # Extract the base filename without the .wav extension
-                # e.g., "C:\path\work_room\myfile.wav" -> "myfile"
-                base_filename = os.path.splitext(os.path.basename(file_path))[0]
-                
-                # Enqueue the task for processing by the worker thread
-                logger.info("Enqueuing %s for processing", base_filename)
-                work_q.put(base_filename)
+        logger.info("[WAV File Detected] %s", event.src_path)
+        self.debounce(event.src_path)
+
+    def on_modified(self, event):
+        """
+        Triggered when a file or directory is modified.
+        """
+        # Only files still being written matter; later edits are ignored
+        if self.is_pending(event.src_path):
+            self.debounce(event.src_path)
+
+    def rescan(self, folder):
+        """
+        Schedule every .wav in folder that has not been fully processed.
+        
+        Used by the --rescan option to pick up files added while the script
+        was not running. A .wav counts as processed once its translated .srt
+        is next to it or its metadata shows the translate step done; files
+        whose earlier run failed are scheduled again.
+        """
+        with os.scandir(folder) as entries:
+            names = {entry.name for entry in entries if entry.is_file()}
+        for name in sorted(names):
+            base, ext = os.path.splitext(name)
+            if ext.lower() != ".wav" or base + TRANSLATED_SUFFIX in names:
+                continue
+            if meta_store.get(base).get("steps_completed", {}).get("translate"):
+                continue
+            logger.info("[WAV File Found] %s has not been processed yet", name)
+            self.debounce(os.path.join(folder, name))
+
+    def on_stable(self, path):
+        """Enqueue the finished .wav for processing once its size has settled."""
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            self._quiet_sizes.pop(path, None)
+            return
+        if self._quiet_sizes.get(path) != size:
+            # First quiet period, or still growing: check again after another
+            self._quiet_sizes[path] = size
+            self.debounce(path)
+            return
+        del self._quiet_sizes[path]
+        
+        # Extract the base filename without the .wav extension
+        # e.g., "C:\path\work_room\myfile.wav" -> "myfile"
+        base_filename = os.path.splitext(os.path.basename(path))[0]
+        
+        # Submit the task for processing by the worker pool
+        logger.info("Enqueuing %s for processing", base_filename)
+        submit_work(base_filename)
 
 
 # --- Main Script Execution ---
+def _init_runtime():
+    """
+    Create the directories, logging, worker pool and metadata store the
+    workflow needs.
+    
+    Done here rather than at import time, so importing the module (e.g. to
+    reuse file_hash) creates no files or threads.
+    """
+    global executor, meta_store
+    os.makedirs(ARTIFACTS_DIR, exist_ok=True)
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s %(levelname)s %(message)s",
+        handlers=[logging.StreamHandler(), logging.FileHandler(LOG_PATH, encoding="utf-8")]
+    )
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=WORKER_COUNT)
+    meta_store = MetaStore(METADATA_DB_PATH)
+
 def main():
     """
     Sets up the file watcher and starts the monitoring loop.
@@ -403,31 +972,25 @@ def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--resume", help="base filename to resume, without extension")
     parser.add_argument("--from-step", type=int, default=2, choices=[1, 2, 3])
+    parser.add_argument("--rescan", action="store_true",
+                        help="at startup, also process .wav files already in Work_room that have no translated .srt")
     args = parser.parse_args()
     
+    _init_runtime()
+    
     # Handle resume functionality if requested
     if args.resume:
         base = args.resume
-        if args.from_step <= 1:
-            # Full run
-            work_q.put(base)
-        elif args.from_step == 2:
-            # Mark process_audio done if needed and enqueue step2+3
-            m = load_meta(base)
-            m.setdefault("steps_completed", {})["process_audio"] = True
-            save_meta(base, m)
-            work_q.put(base)
+        if args.from_step == 2:
+            # Mark process_audio done if needed so only step2+3 run
+            meta_store.update(base, completed=("process_audio",))
         elif args.from_step == 3:
             # Mark both previous steps done if you want to just run translation
-            m = load_meta(base)
-            m.setdefault("steps_completed", {})["process_audio"] = True
-            m.setdefault("steps_completed", {})["ass_to_srt"] = True
-            save_meta(base, m)
-            work_q.put(base)
+            meta_store.update(base, completed=("process_audio", "ass_to_srt"))
+        # from_step 1 is a full run with no metadata changes
         
-        # Process the queue item and exit
-        # Wait for the worker to finish
-        work_q.join()
+        # Process the file and exit once the worker has finished
+        concurrent.futures.wait([submit_work(base)])
         return
 
     logger.info("Audio Workflow Automation Script Started.")
@@ -439,21 +1002,14 @@ def main():
         logger.error("             Please create the 'Work_room' folder.")
         sys.exit(1)
 
-    # Verify batch scripts exist
+    # Verify the batch script exists
     if not os.path.exists(PROCESS_AUDIO_SCRIPT):
         logger.error("[FATAL ERROR] Required script not found: %s", PROCESS_AUDIO_SCRIPT)
         sys.exit(1)
-    if not os.path.exists(TRANSLATE_SRT_SCRIPT):
-        logger.error("[FATAL ERROR] Required script not found: %s", TRANSLATE_SRT_SCRIPT)
-        sys.exit(1)
-
-    # Verify ffmpeg exists (if using a specific path)
-    if FFMPEG_PATH != "ffmpeg" and not os.path.exists(FFMPEG_PATH):
-        logger.error("[FATAL ERROR] Required ffmpeg executable not found: %s", FFMPEG_PATH)
-        logger.error("             Please ensure ffmpeg.exe is in the script directory or adjust FFMPEG_PATH.")
-        sys.exit(1)
 
     # Create the event handlers and observers
+    global stability_tracker
+    stability_tracker = StabilityTracker()
     wav_handler = WavHandler()
     ass_handler = AssModifiedHandler()
     observer = Observer()
@@ -461,21 +1017,49 @@ def main():
     # Schedule the observer to watch the specified folder for events
     observer.schedule(wav_handler, WATCHED_FOLDER_PATH, recursive=False)
     observer.schedule(ass_handler, SCRIPT_DIR, recursive=False)
+    observer.schedule(stability_tracker, WATCHED_FOLDER_PATH, recursive=False)
+    observer.schedule(stability_tracker, SCRIPT_DIR, recursive=False)
 
     # Start the observer in a background thread
     observer.start()
+    
+    # Optionally pick up .wav files that arrived while the script was not
+    # running; files still being copied are debounced like new ones
+    if args.rescan:
+        wav_handler.rescan(WATCHED_FOLDER_PATH)
     logger.info("Watcher is now active. Press Ctrl+C to stop.")
 
-    try:
-        # Keep the main thread alive
-        while True:
-            time.sleep(1)
-    except KeyboardInterrupt:
-        logger.info("[STOP] Received Ctrl+C. Shutting down watcher...")
+    def request_stop(signum, frame):
+        logger.info("[STOP] Received %s. Shutting down watcher...", signal.Signals(signum).name)
         observer.stop()
+        signal.signal(signal.SIGINT, force_stop)
+        signal.signal(signal.SIGTERM, force_stop)
+    
+    def force_stop(signum, frame):
+        # A second Ctrl+C (or SIGTERM) exits immediately without waiting for
+        # running jobs, killing their child processes so none keep running
+        # after the script is gone
+        logger.info("[STOP] Received %s again. Exiting now...", signal.Signals(signum).name)
+        kill_running_children()
+        logging.shutdown()
+        os._exit(128 + signum)
+    
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+    
+    # Block until a signal handler stops the observer. Windows only runs
+    # signal handlers between waits, so the join is sliced there; elsewhere
+    # the main thread sleeps until the observer exits.
+    while observer.is_alive():
+        observer.join(STOP_CHECK_INTERVAL if os.name == "nt" else None)
     
-    # Wait for the observer thread to finish
-    observer.join()
+    # Drop queued jobs and let the ones already running finish
+    executor.shutdown(wait=False, cancel_futures=True)
+    running = set(_active_futures)
+    if running:
+        logger.info("[STOP] Waiting for %d running job(s) to finish; press Ctrl+C again to exit now...", len(running))
+    while running:
+        running = concurrent.futures.wait(running, timeout=STOP_CHECK_INTERVAL if os.name == "nt" else None).not_done
     logger.info("[STOP] Watcher stopped. Script exited.")
 
 
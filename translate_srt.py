@@ -1,8 +1,346 @@
 import sys
+import os
 import re
 import html
+import time
+import hashlib
+import sqlite3
+import contextlib
+import logging
+import threading
 from googletrans import Translator
 
+logger = logging.getLogger(__name__)
+
+# Marker placed between subtitles so several can be translated in one request
+BATCH_MARKER = "§§§"
+BATCH_SEPARATOR = f"\n{BATCH_MARKER}\n"
+
+# Keep each joined request under the service's ~5000 character limit
+MAX_BATCH_CHARS = 4500
+
+# Maximum number of subtitles joined into one request
+MAX_BATCH_ITEMS = 100
+
+# Joined attempts per batch before translating its subtitles one by one
+BATCH_RETRIES = 2
+
+# Attempts per subtitle when translating one by one, and the first backoff
+# delay in seconds (doubled after each failure)
+ITEM_RETRIES = 3
+RETRY_DELAY = 1.0
+
+# Subtitles in a row that may fail to translate before the service is
+# considered unreachable and the remaining subtitles are left untranslated
+MAX_CONSECUTIVE_FAILURES = 3
+
+# Seconds before a translation request times out
+REQUEST_TIMEOUT = 10.0
+
+# Persistent cache of previous translations
+CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "artifacts", "translate_cache.sqlite")
+
+# Maximum number of cached translations; the least recently used are
+# evicted beyond this
+CACHE_MAX_ENTRIES = 200000
+
+# Markup the translation service may return around subtitle text:
+# HTML tags, or ASS/SSA style tags like {\an5}
+MARKUP_RE = re.compile(r'<[^>]+>|{\\[^}]*}')
+
+# Shared Translator, created on first use by get_translator
+_translator = None
+_translator_lock = threading.Lock()
+
+def get_translator():
+    """
+    Return the shared Translator instance, creating it on first use.
+    
+    Reusing one Translator keeps its HTTP connection pool (and TLS session)
+    alive across batches and files.
+    
+    Returns:
+        Translator: Translator instance to use
+    """
+    global _translator
+    with _translator_lock:
+        if _translator is None:
+            # Older googletrans releases lack http2, and the oldest timeout too
+            for kwargs in ({"timeout": REQUEST_TIMEOUT, "http2": True}, {"timeout": REQUEST_TIMEOUT}, {}):
+                try:
+                    _translator = Translator(**kwargs)
+                    break
+                except TypeError:
+                    if not kwargs:
+                        raise
+        return _translator
+
+class TranslationUnavailable(Exception):
+    """Raised when MAX_CONSECUTIVE_FAILURES subtitles in a row failed to translate."""
+    
+    def __init__(self, results):
+        super().__init__(f"{MAX_CONSECUTIVE_FAILURES} subtitles in a row failed to translate")
+        # Results for the texts attempted before giving up
+        self.results = results
+
+def clean_translation(text):
+    """
+    Strip markup that the translation service may return around subtitle text.
+    
+    Args:
+        text (str): Translated text
+        
+    Returns:
+        str: Text without HTML/ASS tags or HTML entities
+    """
+    # Remove HTML and ASS/SSA style tags in one pass
+    text = MARKUP_RE.sub('', text)
+    # Unescape HTML entities
+    text = html.unescape(text)
+    # Remove extra whitespace
+    return text.strip()
+
+def iter_blocks(content):
+    """
+    Split SRT content into blocks in a single pass over its lines.
+    
+    Blocks are separated by one or more blank (or whitespace-only) lines.
+    
+    Args:
+        content (str): SRT file content
+        
+    Yields:
+        tuple: (number, time_code, text) for each block, where text may span
+            multiple lines; a block with fewer than three lines is yielded
+            as (block, None, None) so it can be written back unchanged
+    """
+    lines = iter(content.strip().split('\n'))
+    for line in lines:
+        if not line.strip():
+            continue
+        block = [line]
+        for line in lines:
+            if not line.strip():
+                break
+            block.append(line)
+        if len(block) >= 3:
+            yield block[0].lstrip(), block[1], '\n'.join(block[2:]).rstrip()
+        else:
+            yield '\n'.join(block), None, None
+
+def translate_one(translator, text, dest_lang):
+    """
+    Translate a single subtitle text.
+    
+    Failed requests are retried with exponential backoff, since failures
+    are usually rate limiting or transient network errors.
+    
+    Args:
+        translator (Translator): Translator instance to use
+        text (str): Subtitle text
+        dest_lang (str): Destination language code
+        
+    Returns:
+        str: Translated text, or None if every attempt failed
+    """
+    delay = RETRY_DELAY
+    for attempt in range(1, ITEM_RETRIES + 1):
+        try:
+            return clean_translation(translator.translate(text, dest=dest_lang).text)
+        except Exception as e:
+            logger.warning("Error translating subtitle %.60r (attempt %d): %s", text, attempt, e)
+            if attempt < ITEM_RETRIES:
+                time.sleep(delay)
+                delay *= 2
+    return None
+
+def iter_batches(texts, max_chars=MAX_BATCH_CHARS, max_items=MAX_BATCH_ITEMS):
+    """
+    Group texts into consecutive batches whose joined size stays under
+    max_chars and that hold at most max_items texts.
+    
+    Args:
+        texts (list): Subtitle texts
+        max_chars (int): Size limit of one joined request
+        max_items (int): Maximum number of texts per request
+        
+    Yields:
+        list: A batch of texts (always at least one)
+    """
+    batch = []
+    size = 0
+    for text in texts:
+        added = len(text) + len(BATCH_SEPARATOR)
+        if batch and (size + added > max_chars or len(batch) >= max_items):
+            yield batch
+            batch = []
+            size = 0
+        batch.append(text)
+        size += added
+    if batch:
+        yield batch
+
+def translate_batch(translator, batch, dest_lang, retries=BATCH_RETRIES):
+    """
+    Translate a batch of texts with one request, joined by BATCH_SEPARATOR.
+    
+    A failed request is retried; if the response does not split back into
+    the same number of texts (e.g. the separator was altered), retrying
+    would return the same response, so every text is translated on its
+    own straight away.
+    
+    Args:
+        translator (Translator): Translator instance to use
+        batch (list): Subtitle texts
+        dest_lang (str): Destination language code
+        retries (int): Number of joined attempts before falling back
+        
+    Returns:
+        list: Translated texts in the same order, None where a text failed
+        
+    Raises:
+        TranslationUnavailable: If MAX_CONSECUTIVE_FAILURES texts in a row
+            failed in the one-by-one fallback
+    """
+    for _ in range(retries):
+        try:
+            translated = translator.translate(BATCH_SEPARATOR.join(batch), dest=dest_lang)
+        except Exception as e:
+            logger.warning("Error translating batch of %d subtitles: %s", len(batch), e)
+            continue
+        parts = translated.text.split(BATCH_MARKER)
+        if len(parts) == len(batch):
+            return [clean_translation(part) for part in parts]
+        logger.warning("Batch of %d subtitles came back as %d parts, translating one by one", len(batch), len(parts))
+        break
+    
+    # Fall back to one request per subtitle, giving up once the service
+    # looks unreachable rather than backing off on every remaining subtitle
+    results = []
+    failures = 0
+    for text in batch:
+        result = translate_one(translator, text, dest_lang)
+        results.append(result)
+        failures = failures + 1 if result is None else 0
+        if failures >= MAX_CONSECUTIVE_FAILURES:
+            raise TranslationUnavailable(results)
+    return results
+
+def open_cache(path=None):
+    """
+    Open (creating if needed) the on-disk translation cache.
+    
+    Args:
+        path (str): Path to the SQLite cache file (default: CACHE_PATH)
+        
+    Returns:
+        sqlite3.Connection: Connection to the cache database
+    """
+    path = path or CACHE_PATH
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("CREATE TABLE IF NOT EXISTS translations "
+                 "(k BLOB PRIMARY KEY, v TEXT, last_used REAL NOT NULL DEFAULT 0)")
+    # Caches created before eviction was added lack the last_used column
+    if "last_used" not in {row[1] for row in conn.execute("PRAGMA table_info(translations)")}:
+        conn.execute("ALTER TABLE translations ADD COLUMN last_used REAL NOT NULL DEFAULT 0")
+    conn.execute("CREATE INDEX IF NOT EXISTS translations_last_used ON translations (last_used)")
+    conn.commit()
+    return conn
+
+def prune_cache(conn, max_entries=None):
+    """
+    Evict the least recently used translations beyond max_entries.
+    
+    Args:
+        conn (sqlite3.Connection): Connection from open_cache
+        max_entries (int): Number of entries to keep (default: CACHE_MAX_ENTRIES)
+    """
+    max_entries = max_entries or CACHE_MAX_ENTRIES
+    excess = conn.execute("SELECT COUNT(*) FROM translations").fetchone()[0] - max_entries
+    if excess > 0:
+        with conn:
+            conn.execute("DELETE FROM translations WHERE k IN "
+                         "(SELECT k FROM translations ORDER BY last_used LIMIT ?)", (excess,))
+
+def cache_key(text, dest_lang):
+    """Return the cache key for a text translated to dest_lang."""
+    return hashlib.sha1(f"{dest_lang}\0{text}".encode("utf-8")).digest()
+
+def translate_texts(texts, dest_lang='zh-tw'):
+    """
+    Translate a list of subtitle texts to the specified language.
+    
+    Previously translated texts are served from the on-disk cache; each
+    distinct remaining text is translated once, in as few requests as
+    possible (see translate_batch).
+    
+    Args:
+        texts (list): Subtitle texts (may contain multiple lines each)
+        dest_lang (str): Destination language code (default: 'zh-tw' for Traditional Chinese)
+        
+    Returns:
+        list: Translated texts in the same order; any text that fails to
+            translate is returned unchanged
+            
+    Raises:
+        TranslationUnavailable: If the service stopped responding (see
+            translate_batch); texts translated before that are cached
+    """
+    with contextlib.closing(open_cache()) as cache:
+        results = []
+        hits = set()
+        for text in texts:
+            key = cache_key(text, dest_lang)
+            row = cache.execute("SELECT v FROM translations WHERE k = ?", (key,)).fetchone()
+            results.append(row[0] if row else None)
+            if row:
+                hits.add(key)
+        
+        # Mark the cached translations as recently used
+        now = time.time()
+        if hits:
+            with cache:
+                cache.executemany("UPDATE translations SET last_used = ? WHERE k = ?",
+                                  [(now, key) for key in hits])
+        
+        # Translate each distinct uncached text once
+        missing = list(dict.fromkeys(text for text, result in zip(texts, results) if result is None))
+        logger.info("%d of %d subtitles found in the translation cache",
+                    sum(result is not None for result in results), len(texts))
+        
+        translated = {}
+        if missing:
+            translator = get_translator()
+            unavailable = None
+            for batch in iter_batches(missing):
+                try:
+                    translated.update(zip(batch, translate_batch(translator, batch, dest_lang)))
+                except TranslationUnavailable as e:
+                    translated.update(zip(batch, e.results))
+                    unavailable = e
+                    break
+                logger.info("Translated %d of %d subtitles", len(translated), len(missing))
+            
+            with cache:
+                cache.executemany("INSERT OR IGNORE INTO translations (k, v, last_used) VALUES (?, ?, ?)",
+                                  [(cache_key(text, dest_lang), result, now)
+                                   for text, result in translated.items() if result is not None])
+            prune_cache(cache)
+            
+            # Keep what was translated in the cache, but fail the file so it
+            # is retried rather than written half untranslated
+            if unavailable is not None:
+                raise unavailable
+    
+    results = [result if result is not None else translated.get(text)
+               for text, result in zip(texts, results)]
+    
+    # Keep the original text if translation fails
+    return [result if result is not None else text for text, result in zip(texts, results)]
+
 def translate_srt(input_file, output_file, dest_lang='zh-tw'):
     """
     Translate an SRT file to the specified language.
@@ -11,62 +349,35 @@ def translate_srt(input_file, output_file, dest_lang='zh-tw'):
         input_file (str): Path to the input SRT file
         output_file (str): Path to the output translated SRT file
         dest_lang (str): Destination language code (default: 'zh-tw' for Traditional Chinese)
+        
+    Raises:
+        TranslationUnavailable: If the service stopped responding; no
+            output file is written
     """
-    translator = Translator()
-    
     with open(input_file, 'r', encoding='utf-8') as f:
         content = f.read()
     
-    # Split the SRT file into blocks
-    blocks = re.split(r'\n\s*\n', content.strip())
+    # Split the SRT file into (number, time code, text) blocks
+    blocks = list(iter_blocks(content))
     
-    translated_blocks = []
+    translated_texts = iter(translate_texts([text for _, time_code, text in blocks if time_code is not None], dest_lang))
     
-    for i, block in enumerate(blocks, 1):
-        lines = block.strip().split('\n')
-        if len(lines) >= 3:
-            # First line is the subtitle number
-            subtitle_number = lines[0]
-            # Second line is the time code
-            time_code = lines[1]
-            # The rest are the subtitle text (may be multiple lines)
-            subtitle_text = '\n'.join(lines[2:])
-            
-            # Translate the subtitle text
-            try:
-                translated = translator.translate(subtitle_text, dest=dest_lang)
-                translated_text = translated.text
-                
-                # Remove HTML tags from translated text
-                translated_text = re.sub(r'<[^>]+>', '', translated_text)
-                # Remove ASS/SSA style tags like {\an5}
-                translated_text = re.sub(r'{\\[^}]*}', '', translated_text)
-                # Unescape HTML entities
-                translated_text = html.unescape(translated_text)
-                # Remove extra whitespace
-                translated_text = translated_text.strip()
-                
-                # Create the translated block
-                translated_block = f"{subtitle_number}\n{time_code}\n{translated_text}"
-                translated_blocks.append(translated_block)
-                
-                print(f"Translated subtitle {i}")
-            except Exception as e:
-                print(f"Error translating subtitle {i}: {e}")
-                # Keep the original text if translation fails
-                translated_block = f"{subtitle_number}\n{time_code}\n{subtitle_text}"
-                translated_blocks.append(translated_block)
-        else:
-            # Keep the block as is if it doesn't match the expected format
-            translated_blocks.append(block)
-    
-    # Write the translated content to the output file
+    # Write the translated blocks to the output file one at a time
     with open(output_file, 'w', encoding='utf-8') as f:
-        f.write('\n\n'.join(translated_blocks) + '\n\n')
+        for subtitle_number, time_code, _ in blocks:
+            if time_code is not None:
+                f.write(f"{subtitle_number}\n{time_code}\n{next(translated_texts)}")
+            else:
+                # Keep the block as is if it doesn't match the expected format
+                f.write(subtitle_number)
+            f.write('\n\n')
     
     print(f"Translation complete. Output saved to {output_file}")
 
 if __name__ == "__main__":
+    # Show the translation progress logged by translate_texts
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    
     if len(sys.argv) < 2:
         print("Usage: python translate_srt.py <input_file.srt> [output_file.srt]")
         sys.exit(1)
@@ -79,4 +390,8 @@ if __name__ == "__main__":
         # Default output file name: insert _zh-tw before .srt extension
         output_file = input_file.replace('.srt', '_zh-tw.srt')
     
-    translate_srt(input_file, output_file)
\ No newline at end of file
+    try:
+        translate_srt(input_file, output_file)
+    except TranslationUnavailable as e:
+        print(f"Translation failed: {e}")
+        sys.exit(1)
\ No newline at end of file